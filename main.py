@@ -1,13 +1,17 @@
+import asyncio
+import atexit
 import logging
 from logging.handlers import RotatingFileHandler
-from seleniumbase import SB
-from selenium.webdriver.common.by import By
-import platform
+import aiohttp
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
-import json
-import subprocess
-from datetime import datetime, timedelta
+import orjson
+import queue
+import re
+import threading
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -22,208 +26,363 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+_CACHE_TTL = 24 * 3600  # seconds a sent token is remembered
+_ANCHOR_RE = re.compile(r"<a\b[^>]*>")
+_PAIR_HREF_RE = re.compile(r'href="/[a-z]+/(\w+)"')
+
 
 class DexScreenerScraper:
+    _MSG_TEMPLATE = """
+        🚀 <b>New Fast Mover</b>
+
+💎 <b>Coin:</b> {token_symbol}
+💰 <b>Market Cap:</b> ${market_cap:,.0f}
+⏰ <b>Age:</b> {pair_age}
+📈 <b>Volume:</b> ${volume:,.0f}
+🔗 <b>Contract Address: </b> <a href="{ds_url}">{_addr}</a>
+"""
+
     def __init__(self):
         self.telegram_bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
         self.telegram_chat_id = os.getenv("TELEGRAM_CHAT_ID")
         self.scraperapi_api_key = os.getenv("SCRAPERAPI_API_KEY")
+        self._tg_url = f"https://api.telegram.org/bot{self.telegram_bot_token}/sendMessage"
+        self.session = self._create_session()
+        self.telegram_concurrency = 5
+        self.telegram_max_attempts = 3
         self.url = "https://dexscreener.com/?rankBy=trendingScoreM5&order=desc&chainIds=solana&minMarketCap=40000&maxMarketCap=800000"
+        self.scraperapi_url = "https://api.scraperapi.com/"
+        self.api_url = "https://api.dexscreener.com"
+        self.chain_id = "solana"
+        self.max_pairs = 100  # rows in the trending table
+        self.pairs_per_request = 30  # DexScreener limit for /latest/dex/pairs
         self.price_change_fields = ["price-change-m5", "price-change-h1", "price-change-h6", "price-change-h24"]
+        # Maps each coin_data field to its key path in a DexScreener pair object
         self.coin_data_fields = {
-            "ds_url": {"attr": "href"},
-            **{field: {"class": f"ds-dex-table-row-col-{field}"} for field in self.price_change_fields},
-            "token_symbol": {"class": "ds-dex-table-row-base-token-symbol"},
-            "price": {"class": "ds-dex-table-row-col-price"},
-            "pair_age": {"class": "ds-dex-table-row-col-pair-age"},
-            "txns": {"class": "ds-dex-table-row-col-txns"},
-            "volume": {"class": "ds-dex-table-row-col-volume"},
-            "makers": {"class": "ds-dex-table-row-col-makers"},
-            "liquidity": {"class": "ds-dex-table-row-col-liquidity"},
-            "market_cap": {"class": "ds-dex-table-row-col-market-cap"},
+            "ds_url": ("url",),
+            **{field: ("priceChange", field.rsplit("-", 1)[1]) for field in self.price_change_fields},
+            "token_symbol": ("baseToken", "symbol"),
+            "price": ("priceUsd",),
+            "pair_created_at": ("pairCreatedAt",),
+            "volume": ("volume", "h24"),
+            "liquidity": ("liquidity", "usd"),
+            "market_cap": ("marketCap",),
         }
         self.cache_file = "sent_tokens.json"
         self.load_cache()
+        self._save_q = queue.Queue()
+        self._writer_thread = threading.Thread(target=self._writer, daemon=True)
+        self._writer_thread.start()
+        self._closed = False
+        # Flush the cache at exit even when the scraper is used without a with block
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.close)
+        # Let the writer flush any pending snapshot before shutting down
+        self._save_q.put(None)
+        self._writer_thread.join()
+        self.session.close()
+
+    def _create_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=16,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.5,
+                status_forcelist=[429, 500, 502, 503, 504],
+                # Never retry POSTs, a resent sendMessage could deliver the same alert twice
+                allowed_methods=frozenset(["GET"]),
+            ),
+        )
+        session.mount("https://", adapter)
+        return session
 
     def load_cache(self):
         try:
             if os.path.exists(self.cache_file):
-                logger.debug(f"Loading cache from {self.cache_file}")
-                with open(self.cache_file, "r") as f:
-                    self.sent_tokens = json.load(f)
-                # Clean up old entries (older than 24 hours)
-                current_time = datetime.now().timestamp()
-                old_count = len(self.sent_tokens)
-                self.sent_tokens = {
-                    token: timestamp
-                    for token, timestamp in self.sent_tokens.items()
-                    if current_time - timestamp < 24 * 3600
-                }
-                logger.debug(f"Cleaned up cache: removed {old_count - len(self.sent_tokens)} old entries")
+                logger.debug("Loading cache from %s", self.cache_file)
+                with open(self.cache_file, "rb") as f:
+                    self.sent_tokens = orjson.loads(f.read())
+                if not isinstance(self.sent_tokens, dict):
+                    raise ValueError(f"expected a JSON object, got {type(self.sent_tokens).__name__}")
             else:
                 logger.debug("Cache file not found, creating new cache")
                 self.sent_tokens = {}
         except Exception as e:
             logger.error(f"Error loading cache from {self.cache_file}: {str(e)}", exc_info=True)
             self.sent_tokens = {}
+        self.prune_cache()
+
+    def prune_cache(self):
+        # Clean up old entries (older than 24 hours)
+        current_time = time.time()
+        old_count = len(self.sent_tokens)
+        # Non-numeric timestamps can only come from a hand-edited or corrupt cache, drop them too
+        self.sent_tokens = {
+            token: timestamp
+            for token, timestamp in self.sent_tokens.items()
+            if isinstance(timestamp, (int, float)) and current_time - timestamp < _CACHE_TTL
+        }
+        self._recent = set(self.sent_tokens)
+        logger.debug("Cleaned up cache: removed %d old entries", old_count - len(self.sent_tokens))
 
     def save_cache(self):
+        # Written by the background writer thread so disk I/O stays off the scrape loop.
+        # Once close() has stopped the writer, fall back to writing synchronously.
+        if self._closed:
+            self._write_cache(dict(self.sent_tokens))
+        else:
+            self._save_q.put(dict(self.sent_tokens))
+
+    def _writer(self):
+        while True:
+            snapshot = self._save_q.get()
+            stop = snapshot is None
+            # Coalesce queued snapshots, only the newest one needs writing
+            while not self._save_q.empty():
+                item = self._save_q.get_nowait()
+                if item is None:
+                    stop = True
+                else:
+                    snapshot = item
+            if snapshot is not None:
+                self._write_cache(snapshot)
+            if stop:
+                return
+
+    def _write_cache(self, sent_tokens):
         try:
-            logger.debug(f"Saving {len(self.sent_tokens)} entries to cache")
-            with open(self.cache_file, "w") as f:
-                json.dump(self.sent_tokens, f)
+            logger.debug("Saving %d entries to cache", len(sent_tokens))
+            # Write to a temp file and swap it in so a crash never leaves a truncated cache
+            tmp_file = self.cache_file + ".tmp"
+            with open(tmp_file, "wb") as f:
+                f.write(orjson.dumps(sent_tokens))
+            os.replace(tmp_file, self.cache_file)
             logger.debug("Cache saved successfully")
         except Exception as e:
             logger.error(f"Error saving cache to {self.cache_file}: {str(e)}", exc_info=True)
 
     def was_token_sent_recently(self, token_address):
-        current_time = datetime.now().timestamp()
-        if token_address in self.sent_tokens:
-            # Check if token was sent in the last 24 hours
-            return current_time - self.sent_tokens[token_address] < 24 * 3600
-        return False
+        # _recent only holds tokens sent within _CACHE_TTL, see prune_cache()
+        return token_address in self._recent
 
     def mark_token_as_sent(self, token_address):
-        self.sent_tokens[token_address] = datetime.now().timestamp()
-        self.save_cache()
+        # Flushed to disk once per scrape pass, see scrape()
+        self.sent_tokens[token_address] = time.time()
+        self._recent.add(token_address)
 
-    def send_to_telegram(self, coin_data):
-        token_address = coin_data["ds_url"].split("/")[-1]
+    async def _send(self, session, semaphore, coin_data):
+        token_address = coin_data["_addr"]
         logger.info(f"Preparing to send Telegram message for token {coin_data['token_symbol']} ({token_address})")
-        message_format = """
-        🚀 <b>New Fast Mover</b>
-
-💎 <b>Coin:</b> {}
-💰 <b>Market Cap:</b> {}
-⏰ <b>Age:</b> {}
-📈 <b>Volume:</b> {}
-🔗 <b>Contract Address: </b> <a href="{}">{}</a>
-"""
-        send_message_url = f"https://api.telegram.org/bot{self.telegram_bot_token}/sendMessage"
+        coin_data["pair_age"] = self.format_pair_age(coin_data["pair_created_at"])
+        coin_data["market_cap"] = coin_data["market_cap"] or 0
+        coin_data["volume"] = coin_data["volume"] or 0
         params = {
             "chat_id": self.telegram_chat_id,
-            "text": message_format.format(
-                coin_data["token_symbol"],
-                coin_data["market_cap"],
-                coin_data["pair_age"],
-                coin_data["volume"],
-                coin_data["ds_url"],
-                token_address,
-            ),
+            "text": self._MSG_TEMPLATE.format_map(coin_data),
             "parse_mode": "HTML",
         }
+        for attempt in range(1, self.telegram_max_attempts + 1):
+            try:
+                async with semaphore:
+                    async with session.post(self._tg_url, data=params) as response:
+                        if response.status == 429:
+                            retry_after = await self._retry_after(response)
+                        else:
+                            response.raise_for_status()
+                            logger.info(f"Successfully sent Telegram message for {coin_data['token_symbol']}")
+                            self.mark_token_as_sent(token_address)
+                            return
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.error(f"Failed to send Telegram message for {coin_data['token_symbol']}: {str(e)}", exc_info=True)
+                return
+            if attempt == self.telegram_max_attempts:
+                break
+            # Sleep outside the semaphore so other sends are not held up
+            logger.warning(f"Telegram rate limit hit for {coin_data['token_symbol']}, retrying in {retry_after}s")
+            await asyncio.sleep(retry_after)
+        logger.error(
+            f"Failed to send Telegram message for {coin_data['token_symbol']}: "
+            f"still rate limited after {self.telegram_max_attempts} attempts"
+        )
+
+    async def _retry_after(self, response):
+        # Fall back to a 1s backoff when a 429 carries no usable retry_after
         try:
-            response = requests.get(send_message_url, params=params)
+            payload = await response.json(content_type=None)
+        except ValueError:
+            return 1
+        parameters = payload.get("parameters") if isinstance(payload, dict) else None
+        retry_after = parameters.get("retry_after") if isinstance(parameters, dict) else None
+        return retry_after if isinstance(retry_after, (int, float)) and retry_after >= 0 else 1
+
+    async def _dispatch(self, candidates):
+        logger.info(f"Sending {len(candidates)} Telegram messages")
+        semaphore = asyncio.Semaphore(self.telegram_concurrency)
+        connector = aiohttp.TCPConnector(limit=8, keepalive_timeout=60)
+        timeout = aiohttp.ClientTimeout(total=10)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            # return_exceptions so one failed send does not cancel the others
+            results = await asyncio.gather(
+                *[self._send(session, semaphore, coin_data) for coin_data in candidates], return_exceptions=True
+            )
+        for coin_data, result in zip(candidates, results):
+            if isinstance(result, Exception):
+                logger.error(
+                    f"Failed to send Telegram message for {coin_data['token_symbol']}: {str(result)}", exc_info=result
+                )
+
+    def parse_pair_addresses(self, html):
+        pair_addresses = []
+        for tag in _ANCHOR_RE.findall(html):
+            if "ds-dex-table-row" not in tag:
+                continue
+            match = _PAIR_HREF_RE.search(tag)
+            if match:
+                pair_addresses.append(match.group(1))
+        return list(dict.fromkeys(pair_addresses))
+
+    def fetch_trending_pairs(self):
+        if not self.scraperapi_api_key:
+            raise ValueError("SCRAPERAPI_API_KEY is not set")
+        # The ranking comes from the trending page itself, fetched through ScraperAPI to get past
+        # Cloudflare. render=true runs the page's JS so the table rows are in the returned HTML.
+        logger.debug("Fetching trending page %s via ScraperAPI", self.url)
+        response = self.session.get(
+            self.scraperapi_url,
+            params={"api_key": self.scraperapi_api_key, "url": self.url, "render": "true"},
+            timeout=70,
+        )
+        response.raise_for_status()
+        pair_addresses = self.parse_pair_addresses(response.text)[: self.max_pairs]
+        logger.debug("Found %d ranked pairs", len(pair_addresses))
+
+        # Row fields come from the JSON API so they arrive as native numbers
+        pairs = {}
+        for i in range(0, len(pair_addresses), self.pairs_per_request):
+            chunk = ",".join(pair_addresses[i : i + self.pairs_per_request])
+            response = self.session.get(f"{self.api_url}/latest/dex/pairs/{self.chain_id}/{chunk}", timeout=10)
             response.raise_for_status()
-            logger.info(f"Successfully sent Telegram message for {coin_data['token_symbol']}")
-            self.mark_token_as_sent(token_address)
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to send Telegram message for {coin_data['token_symbol']}: {str(e)}", exc_info=True)
+            for pair in response.json().get("pairs") or []:
+                pairs[pair["pairAddress"]] = pair
 
-    def get_coin_data(self, coin_selector):
-        try:
-            logger.debug("Extracting coin data from selector")
-            coin_data = {}
-            for field, config in self.coin_data_fields.items():
-                try:
-                    if "attr" in config:
-                        coin_data[field] = coin_selector.get_attribute(config["attr"])
-                    else:
-                        coin_data[field] = coin_selector.find_element(By.CLASS_NAME, config["class"]).text
-                    logger.debug(f"Extracted {field}: {coin_data[field]}")
-                except Exception as field_error:
-                    logger.error(f"Failed to extract field {field}: {str(field_error)}")
-                    coin_data[field] = None
-            return coin_data
-        except Exception as e:
-            logger.error(f"Error getting coin data: {str(e)}", exc_info=True)
-            raise
+        # Keep the page order and only the highest-ranked pool per token so each token is alerted once
+        ranked = {}
+        for pair_address in pair_addresses:
+            pair = pairs.get(pair_address)
+            if pair is not None:
+                ranked.setdefault(pair["baseToken"]["address"], pair)
+        return list(ranked.values())
+
+    def get_coin_data(self, pair):
+        logger.debug("Extracting coin data from pair")
+        debug = logger.isEnabledFor(logging.DEBUG)
+        coin_data = {}
+        for field, path in self.coin_data_fields.items():
+            value = pair
+            for key in path:
+                value = value.get(key) if isinstance(value, dict) else None
+            coin_data[field] = value
+            if debug:
+                logger.debug("Extracted %s: %s", field, value)
+        return coin_data
 
     def check_price_changes(self, coin_data):
-        try:
-            logger.debug(f"Checking price changes for {coin_data['token_symbol']}")
-            price_changes = [
-                float(coin_data[field].replace("%", "").replace(",", "")) for field in self.price_change_fields
-            ]
-            logger.debug(f"Price changes: {dict(zip(self.price_change_fields, price_changes))}")
-            result = all(change > 0 for change in price_changes)
-            logger.debug(f"Price change check result: {result}")
-            return result
-        except ValueError as e:
-            logger.error(f"Error parsing price changes for {coin_data.get('token_symbol', 'unknown')}: {str(e)}")
-            return False
+        logger.debug("Checking price changes for %s", coin_data["token_symbol"])
+        # Lazy so the check stops at the first missing or non-positive change
+        result = all(
+            coin_data[field] is not None and coin_data[field] > 0 for field in self.price_change_fields
+        )
+        logger.debug("Price change check result: %s", result)
+        return result
 
-    def check_pair_age(self, pair_age):
-        logger.debug(f"Checking pair age: {pair_age}")
-        if not pair_age or not pair_age[:-1].isdigit():
-            logger.debug(f"Invalid pair age format: {pair_age}")
+    def check_pair_age(self, pair_created_at):
+        logger.debug("Checking pair created at: %s", pair_created_at)
+        if not pair_created_at:
+            logger.debug("Missing pair creation time")
             return False
-        value = float(pair_age[:-1])
-        result = pair_age.endswith("m") or (pair_age.endswith("h") and value <= 24)
-        logger.debug(f"Pair age check result: {result}")
+        age = time.time() - pair_created_at / 1000
+        result = age <= 24 * 3600
+        logger.debug("Pair age check result: %s", result)
         return result
 
-    def cleanup_temp_files(self):
-        try:
-            if platform.system() == "Linux":
-                try:
-                    subprocess.run(["pkill", "-f", "chrome"], check=False)
-                    subprocess.run(["pkill", "-f", "chromedriver"], check=False)
-                    logger.debug("Cleaned up Chrome processes")
-                except Exception as e:
-                    logger.error(f"Error cleaning up Chrome processes: {str(e)}", exc_info=True)
-
-        except Exception as e:
-            logger.error(f"Error during cleanup: {str(e)}", exc_info=True)
+    def format_pair_age(self, pair_created_at):
+        if not pair_created_at:
+            return "unknown"
+        minutes = max(int(time.time() - pair_created_at / 1000) // 60, 0)
+        if minutes < 60:
+            return f"{minutes}m"
+        if minutes < 24 * 60:
+            return f"{minutes // 60}h"
+        return f"{minutes // (24 * 60)}d"
 
     def scrape(self):
         logger.info("Starting scraping process")
         try:
-            with SB(uc=True, incognito=True, xvfb=True, undetectable=True, page_load_strategy="eager") as sb:
+            self.prune_cache()
+            pairs = self.fetch_trending_pairs()
+            logger.info(f"Fetched {len(pairs)} trending pairs from DexScreener")
+
+            candidates = []
+            for pair in pairs:
+                # Skip already-sent tokens before extracting the remaining fields
+                token_address = pair["baseToken"]["address"]
+                if self.was_token_sent_recently(token_address):
+                    continue
+
+                coin_data = self.get_coin_data(pair)
+                coin_data["_addr"] = token_address
+
+                if (
+                    self.check_pair_age(coin_data["pair_created_at"])
+                    and self.check_price_changes(coin_data)
+                ):
+                    candidates.append(coin_data)
+
+            if candidates:
                 try:
-                    logger.info(f"Opening URL: {self.url}")
-                    sb.uc_open_with_reconnect(self.url, 5)
-
-                    logger.info("Handling captcha based on platform")
-                    if platform.system() == "Linux":
-                        logger.debug("Linux platform detected, using uc_gui_click_captcha")
-                        sb.uc_gui_click_captcha()
-                    else:
-                        logger.debug("Non-Linux platform detected, using uc_gui_handle_captcha")
-                        sb.uc_gui_handle_captcha()
-
-                    for i in range(1, 101):
-                        coin_selector = sb.find_element(f'//*[@id="root"]/div/main/div/div[4]/a[{i}]')
-                        coin_data = self.get_coin_data(coin_selector)
-                        token_address = coin_data["ds_url"].split("/")[-1]
-
-                        if (
-                            not self.was_token_sent_recently(token_address)
-                            and self.check_price_changes(coin_data)
-                            and self.check_pair_age(coin_data["pair_age"])
-                        ):
-                            self.send_to_telegram(coin_data)
+                    asyncio.run(self._dispatch(candidates))
                 finally:
-                    try:
-                        sb.clear_session_storage()
-                        sb.delete_all_cookies()
-                        sb.driver.quit()
-                    except Exception as e:
-                        logger.error(f"Error during browser cleanup: {e}")
+                    self.save_cache()
 
         except Exception as e:
             logger.error(f"Scraping failed: {str(e)}", exc_info=True)
             raise
-        finally:
-            self.cleanup_temp_files()
+
+    def run_forever(self, interval_s):
+        logger.info(f"Polling DexScreener every {interval_s}s")
+        while True:
+            started = time.monotonic()
+            try:
+                self.scrape()
+            except requests.exceptions.RequestException:
+                # Drop pooled connections that may be stale and start fresh next pass
+                logger.warning("Recreating HTTP session after request failure")
+                self.session.close()
+                self.session = self._create_session()
+            except Exception:
+                # Already logged by scrape(), keep polling
+                pass
+            time.sleep(max(interval_s - (time.monotonic() - started), 0))
 
 
 if __name__ == "__main__":
     try:
-        scraper = DexScreenerScraper()
-        scraper.scrape()
+        with DexScreenerScraper() as scraper:
+            scraper.run_forever(60)
+    except KeyboardInterrupt:
+        logger.info("Stopped by user")
     except Exception as e:
         logger.error(f"Application failed: {str(e)}", exc_info=True)
-    finally:
-        if "scraper" in locals():
-            scraper.cleanup_temp_files()